@@ -124,7 +124,9 @@ class PluginBase(vaping.io.Thread):
 
         Popen instance
         """
-        self.log.debug("popen %s", " ".join(args))
+        # only join the argv into a string when debug logging is on
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("popen %s", " ".join(args))
         return vaping.io.subprocess.Popen(args, **kwargs)
 
     @property
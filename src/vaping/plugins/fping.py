@@ -1,12 +1,37 @@
+import json
 import logging
+import os
+import select
+from concurrent.futures import ThreadPoolExecutor
 from shutil import which
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import confu.schema
 
 import vaping
 from vaping.io import subprocess
 from vaping.plugins import TimedProbeSchema
 
+# sample counts at or above this are worth the numpy round-trip,
+# below it the plain python reductions win
+NUMPY_MIN_SAMPLES = 64
+
+# module-level logger so the per-line parse path skips the root-logger
+# lookup logging.debug/error would do on every call; the name matches
+# what PluginBase.log resolves for this plugin type
+_LOG = logging.getLogger(__name__)
+
+
+def _text(line):
+    """decode raw fping output lines for log messages"""
+    if isinstance(line, (bytes, bytearray)):
+        return line.decode("utf-8", errors="replace")
+    return line
+
 
 class FPingSchema(TimedProbeSchema):
     """
@@ -23,6 +48,11 @@ class FPingSchema(TimedProbeSchema):
         help="Time in milliseconds that fping waits between successive packets to an individual target",
     )
     command = confu.schema.Str(default="fping", help="Command to run")
+    shard_size = confu.schema.Int(
+        default=64,
+        help="Maximum number of hosts per fping process, larger host lists "
+        "are split across multiple fping processes run in parallel",
+    )
 
 
 class FPingBase(vaping.plugins.TimedProbe):
@@ -38,15 +68,23 @@ class FPingBase(vaping.plugins.TimedProbe):
     - count (`int=5`): number of pings to send
     - period (`int=20`): time in milliseconds that fping waits
     between successive packets to an individual target
+    - shard_size (`int=64`): maximum number of hosts per fping process,
+    larger host lists are split across multiple fping processes run in
+    parallel
 
     # Instanced Attributes
 
     - count (`int`): number of fpings to send
     - period (`int`): time in milliseconds that fping waits between successive packets
+    - shard_size (`int`): maximum number of hosts per fping process
     """
 
     ConfigSchema = FPingSchema
 
+    # populated by plugins whose host list is static (see FPing.init),
+    # left as None when hosts change between probes (see FPingMTR)
+    _host_args_cached = None
+
     def __init__(self, config, ctx):
         super().__init__(config, ctx)
 
@@ -58,34 +96,107 @@ class FPingBase(vaping.plugins.TimedProbe):
 
         self.count = self.config.get("count")
         self.period = self.config.get("period")
+        self.shard_size = self.config.get("shard_size")
         # Detect version during initialization to avoid repeated checks
-        self._fping_version = self.detect_fping_version()
-        self.log.debug(f"Detected fping version: {self._fping_version}")
+        self._fping_version = self.cached_fping_version()
+        self.log.debug("Detected fping version: %s", self._fping_version)
+
+        # config is immutable after init, so the static part of the
+        # fping argv can be built once instead of on every probe cycle
+        self._argv_prefix = [
+            self.config["command"],
+            "-u",  # Unreachable hosts
+            f"-C{self.count}",  # Count
+            f"-p{self.period}",  # Period
+            "-e",  # Elapsed time
+        ]
+        if self._fping_version == 5:
+            # Quiet mode (suppresses per-probe results, shows summary)
+            self._argv_prefix.append("-q")
+
+    def cached_fping_version(self):
+        """
+        Return the fping version for the configured command, going
+        through a small on-disk cache keyed on the resolved command
+        path and its mtime so frequent restarts skip the `-v` probe
+        """
+        command = which(self.config["command"])
+        try:
+            key = f"{command}:{os.path.getmtime(command)}"
+        except OSError:
+            version = self.detect_fping_version()
+            return 4 if version is None else version
+
+        cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        cache_path = os.path.join(cache_dir, "vaping", "fping_version.json")
+
+        try:
+            with open(cache_path) as fh:
+                cache = json.load(fh)
+        except (OSError, ValueError):
+            cache = {}
+
+        version = cache.get(key)
+        if version is not None:
+            return version
+
+        version = self.detect_fping_version()
+        if version is None:
+            # detection failed (e.g. a transient -v timeout) - default
+            # for this run without pinning the fallback on disk
+            return 4
+
+        # drop stale entries for this command and for binaries that no
+        # longer exist, so the file cannot grow without bound; the cache
+        # is best effort - never fail startup over it
+        cache = {
+            k: v
+            for k, v in cache.items()
+            if k.rsplit(":", 1)[0] != command and os.path.exists(k.rsplit(":", 1)[0])
+        }
+        cache[key] = version
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, "w") as fh:
+                json.dump(cache, fh)
+        except OSError:
+            pass
+
+        return version
 
     def detect_fping_version(self):
-        """Detect fping version to determine output format parser"""
+        """
+        Detect fping version to determine output format parser
+
+        Returns the version, or `None` when detection itself failed so
+        callers can default without mistaking the fallback for a real
+        answer
+        """
         try:
             args = [self.config["command"], "-v"]
-            # Use self.popen for consistency and potential future benefits (like handling timeouts)
-            with self.popen(
-                args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-            ) as proc:
-                # Read all output at once after process finishes
-                version_out, _ = proc.communicate()
-                version_out = version_out.decode("utf-8")
-                if "fping: Version 5" in version_out:
-                    return 5
-                # Add checks for other versions if needed
-                return 4  # Default to 4 if not 5
+            proc = subprocess.run(
+                args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=2,
+                close_fds=False,
+            )
+            version_out = proc.stdout.decode("utf-8")
+            if "fping: Version 5" in version_out:
+                return 5
+            # Add checks for other versions if needed
+            return 4  # Default to 4 if not 5
         except FileNotFoundError:
             self.log.critical(f"fping command '{self.config['command']}' not found.")
             raise
         except Exception as e:
-            # Log the error and default to a safe version (e.g., 4)
+            # Log the error and let the caller fall back to version 4
             self.log.error(
                 f"Failed to detect fping version: {e}. Defaulting to version 4."
             )
-            return 4
+            return None
 
     def hosts_args(self):
         """
@@ -104,17 +215,18 @@ class FPingBase(vaping.plugins.TimedProbe):
             else:
                 host_args.append(row)
 
-        # using a set changes the order
-        dedupe = list()
-        for each in host_args:
-            if each not in dedupe:
-                dedupe.append(each)
-        return dedupe
+        # dict.fromkeys dedupes in O(n) while keeping first-seen order
+        # (a set would change the order)
+        return list(dict.fromkeys(host_args))
 
     def parse_verbose(self, line):
         """
         parse output from verbose format
 
+        **Arguments**
+
+        - line (`str` or `bytes`): fping verbose output line
+
         **Returns**
 
         parsed fping result (`dict`)
@@ -129,17 +241,38 @@ class FPingBase(vaping.plugins.TimedProbe):
         - `last`: last fping time
         """
         try:
-            logging.debug(line)
-            (host, pings) = line.split(" : ")
-            cnt = 0
-            lost = 0
-            times = []
-            pings = pings.strip().split(" ")
+            if _LOG.isEnabledFor(logging.DEBUG):
+                _LOG.debug(line)
+            if isinstance(line, (bytes, bytearray)):
+                # fping output is plain ascii - parse at the bytes level
+                # and only decode the short host prefix, skipping a full
+                # utf-8 decode per line
+                host, sep, pings = line.partition(b" : ")
+                host = host.strip().decode("utf-8", errors="replace")
+                lost_marker = b"-"
+            else:
+                host, sep, pings = line.partition(" : ")
+                host = host.strip()
+                lost_marker = "-"
+            if not sep:
+                _LOG.error(f"Failed to parse fping line '{_text(line).strip()}'")
+                return None
+            # split() without an argument also strips surrounding whitespace
+            pings = pings.split()
+            if not pings:
+                return None
             cnt = len(pings)
-            for latency in pings:
-                if latency == "-":
-                    continue
-                times.append(float(latency))
+            arr = None
+            if numpy is not None and cnt >= NUMPY_MIN_SAMPLES:
+                # numpy parses the tokens and reduces with SIMD-backed
+                # loops, which pays off for large -C sample counts
+                arr = numpy.array(
+                    [latency for latency in pings if latency != lost_marker],
+                    dtype=numpy.float64,
+                )
+                times = arr.tolist()
+            else:
+                times = [float(latency) for latency in pings if latency != lost_marker]
 
             lost = cnt - len(times)
             if lost:
@@ -147,54 +280,96 @@ class FPingBase(vaping.plugins.TimedProbe):
             else:
                 loss = 0.0
 
+            # data must stay a plain list - emitters such as zeromq
+            # (send_json) and the vodka/graphsrv pipeline serialize rows
+            # to json, which compact buffers like array.array or a bare
+            # ndarray would break
             rv = {
-                "host": host.strip(),
+                "host": host,
                 "cnt": cnt,
                 "loss": loss,
                 "data": times,
             }
             if times:
-                rv["min"] = min(times)
-                rv["max"] = max(times)
-                rv["avg"] = sum(times) / len(times)
+                if arr is not None:
+                    rv["min"] = float(arr.min())
+                    rv["max"] = float(arr.max())
+                    rv["avg"] = float(arr.mean())
+                else:
+                    # single fused pass instead of separate min/max/sum
+                    # walks over the samples
+                    mn = mx = total = times[0]
+                    for latency in times[1:]:
+                        if latency < mn:
+                            mn = latency
+                        elif latency > mx:
+                            mx = latency
+                        total += latency
+                    rv["min"] = mn
+                    rv["max"] = mx
+                    rv["avg"] = total / len(times)
                 rv["last"] = times[-1]
             return rv
 
         except Exception as e:
             # Log the specific line causing the error for better debugging
-            logging.error(f"Failed to parse fping line '{line.strip()}': {e}")
+            _LOG.error(f"Failed to parse fping line '{_text(line).strip()}': {e}")
             return None  # Return None to indicate parsing failure for this line
 
     def _run_proc(self):
-        args = [
-            self.config["command"],
-            "-u",  # Unreachable hosts
-            "-C%d" % self.count,  # Count
-            "-p%d" % self.period,  # Period
-            "-e",  # Elapsed time
+        host_args = self._host_args_cached
+        if host_args is None:
+            host_args = self.hosts_args()
+
+        if len(host_args) <= self.shard_size:
+            return self._run_shard(host_args)
+
+        # one fping process serializes across its hosts, so wide host
+        # lists are split into shards probed by parallel processes
+        shards = [
+            host_args[i : i + self.shard_size]
+            for i in range(0, len(host_args), self.shard_size)
         ]
+        data = list()
+        with ThreadPoolExecutor(
+            max_workers=min(len(shards), os.cpu_count() or 1)
+        ) as pool:
+            for shard_data in pool.map(self._run_shard, shards):
+                data.extend(shard_data)
+        return data
 
-        # Conditionally add -q for fping version 5
-        if self._fping_version == 5:
-            args.append(
-                "-q"
-            )  # Quiet mode (suppresses per-probe results, shows summary)
-
-        args.extend(self.hosts_args())
+    def _run_shard(self, host_args):
+        args = self._argv_prefix + list(host_args)
         data = list()
 
-        self.log.debug(f"Running fping command: {' '.join(args)}")
+        # skip the argv stringification entirely when debug is off
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Running fping command: %s", " ".join(args))
 
         # get both stdout and stderr
         try:
+            # use a large pipe buffer so draining fping output takes a
+            # handful of big read() syscalls instead of one per line;
+            # close_fds=False skips the per-fork fd-table scan, which
+            # adds up with high ulimits and tight probe intervals
             with self.popen(
-                args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+                args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                bufsize=65536,
+                close_fds=False,
             ) as proc:
-                for line in iter(proc.stdout.readline, b""):
-                    decoded_line = line.decode("utf-8")
-                    parsed_data = self.parse_verbose(decoded_line)
-                    if parsed_data:  # Only append if parsing was successful
-                        data.append(parsed_data)
+                if self._fping_version == 5:
+                    # -q only emits one summary line per host at the end
+                    # of the run, so nothing streams - drain the whole
+                    # pipe in one read instead of a readline loop
+                    out, _ = proc.communicate()
+                    for line in out.splitlines():
+                        parsed_data = self.parse_verbose(line)
+                        if parsed_data:
+                            data.append(parsed_data)
+                else:
+                    self._stream_proc(proc, data)
                 # Check process exit code after reading output
                 proc.wait()
                 if proc.returncode != 0:
@@ -215,6 +390,64 @@ class FPingBase(vaping.plugins.TimedProbe):
 
         return data
 
+    def _stream_proc(self, proc, data):
+        """
+        stream fping verbose output from `proc`, appending parsed
+        results to `data` as lines arrive
+        """
+        # single-threaded drain: poll the pipe and read big chunks into
+        # an accumulator, splitting complete lines off as they arrive -
+        # no reader thread and no per-line readline call
+        fd = proc.stdout.fileno()
+        os.set_blocking(fd, False)
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        buf = bytearray()
+
+        while True:
+            if not poller.poll(1000):
+                # quiet pipe - fping may just be pacing packets, but
+                # stop waiting once the process is gone
+                if proc.poll() is not None:
+                    # drain anything written between the poll timeout
+                    # and the liveness check so a final burst of lines
+                    # is not dropped
+                    while True:
+                        try:
+                            chunk = os.read(fd, 65536)
+                        except BlockingIOError:
+                            break
+                        if not chunk:
+                            break
+                        buf += chunk
+                    break
+                continue
+            try:
+                chunk = os.read(fd, 65536)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                break
+            buf += chunk
+            # keep the trailing partial line in the accumulator
+            *complete, tail = buf.split(b"\n")
+            buf = bytearray(tail)
+            for line in complete:
+                if not line:
+                    continue
+                parsed_data = self.parse_verbose(line)
+                if parsed_data:  # Only append if parsing was successful
+                    data.append(parsed_data)
+
+        # flush whatever is left - the exit drain above may have left
+        # several complete lines plus a partial tail in the accumulator
+        for line in buf.split(b"\n"):
+            if not line:
+                continue
+            parsed_data = self.parse_verbose(line)
+            if parsed_data:
+                data.append(parsed_data)
+
 
 @vaping.plugin.register("fping")
 class FPing(FPingBase):
@@ -228,20 +461,28 @@ class FPing(FPingBase):
     - count (`int=5`): number of pings to send
     - period (`int=20`): time in milliseconds that fping waits
     between successive packets to an individual target
+    - shard_size (`int=64`): maximum number of hosts per fping process,
+    larger host lists are split across multiple fping processes run in
+    parallel
     """
 
     def init(self):
         self.hosts = []
 
-        for name, group_config in list(self.groups.items()):
-            self.hosts.extend(group_config.get("hosts", []))
+        for name, group_config in self.groups.items():
+            hosts = group_config.get("hosts")
+            if hosts:
+                self.hosts.extend(hosts)
+
+        # hosts are set once here and never mutated, so the argv suffix
+        # can be computed once instead of on every probe cycle
+        self._host_args_cached = tuple(self.hosts_args())
 
     def probe(self):
         msg = self.new_message()
-        # Run the fping process and get parsed data
-        proc_data = self._run_proc()
-        # Filter out any None results from parsing errors or ignored lines
-        msg["data"] = [d for d in proc_data if d is not None]
+        # Run the fping process and get parsed data; _run_proc already
+        # drops lines that failed to parse, so no second filter pass
+        msg["data"] = self._run_proc()
         # Only return message if there's valid data
         if msg["data"]:
             return msg
@@ -17,6 +17,15 @@ def _this_dir():
     return os.path.dirname(__file__)
 
 
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path, monkeypatch):
+    """
+    keep caches (e.g. the fping version cache) in a per-test tmp dir
+    instead of reading and writing the developer's real ~/.cache
+    """
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+
 @pytest.fixture
 def this_dir():
     return _this_dir()
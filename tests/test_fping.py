@@ -40,20 +40,83 @@ expect_verbose = {
     "example.com: Temporary failure in name resolution": {},
 }
 
+# the production drain paths hand bytes lines to parse_verbose,
+# so the same expectations need to hold for raw bytes input
+expect_verbose_bytes = {
+    line.encode("utf-8"): expected for line, expected in expect_verbose.items()
+}
+
+
+def assert_parsed(res, expected):
+    if expected:
+        for k, v in list(expected.items()):
+            assert res
+            if isinstance(v, float):
+                assert abs(v - res[k]) < 0.002
+            else:
+                assert v == res[k]
+    else:
+        assert not res
+
 
 def test_parse_verbose():
     fping = vaping.plugins.fping.FPing({"interval": "5s"}, None)
     for line, expected in list(expect_verbose.items()):
-        res = fping.parse_verbose(line)
-        if expected:
-            for k, v in list(expected.items()):
-                assert res
-                if isinstance(v, float):
-                    assert abs(v - res[k]) < 0.002
-                else:
-                    assert v == res[k]
-        else:
-            assert not res
+        assert_parsed(fping.parse_verbose(line), expected)
+
+
+def test_parse_verbose_bytes():
+    fping = vaping.plugins.fping.FPing({"interval": "5s"}, None)
+    for line, expected in list(expect_verbose_bytes.items()):
+        assert_parsed(fping.parse_verbose(line), expected)
+        # the poll drain splits lines out of a bytearray accumulator
+        assert_parsed(fping.parse_verbose(bytearray(line)), expected)
+
+
+def test_run_proc_shards():
+    fping = vaping.plugins.fping.FPing({"interval": "5s", "shard_size": 2}, None)
+    fping.hosts = ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.1"]
+    fping._host_args_cached = tuple(fping.hosts_args())
+
+    shards = []
+
+    def run_shard(host_args):
+        shards.append(list(host_args))
+        return [{"host": host} for host in host_args]
+
+    fping._run_shard = run_shard
+    data = fping._run_proc()
+
+    # deduped host list split into shard_size chunks, results in order
+    assert shards == [["10.0.0.1", "10.0.0.2"], ["10.0.0.3"]]
+    assert [row["host"] for row in data] == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+
+def test_run_proc_quiet_mode(tmp_path):
+    # version 5 adds -q and drains the summary output in one read
+    command = tmp_path / "fake_fping"
+    command.write_text(
+        "#!/bin/sh\n"
+        'if [ "$1" = "-v" ]; then echo "fping: Version 5.0"; exit 0; fi\n'
+        'echo "10.0.0.1 : 1.0 - 3.0"\n'
+    )
+    command.chmod(0o755)
+
+    fping = vaping.plugins.fping.FPing(
+        {"interval": "5s", "command": str(command)}, None
+    )
+    fping.hosts = ["10.0.0.1"]
+    fping._host_args_cached = ("10.0.0.1",)
+
+    assert fping._fping_version == 5
+    assert "-q" in fping._argv_prefix
+
+    data = fping._run_proc()
+    assert len(data) == 1
+    assert_parsed(
+        data[0],
+        {"host": "10.0.0.1", "cnt": 3, "loss": 0.333, "min": 1.0, "max": 3.0},
+    )
 
 
 def test_run_probe(this_dir):